@@ -0,0 +1,110 @@
+# /common/src/common/converter.py
+
+from typing import Any, List, Optional, Sequence, Type
+
+import orjson
+import zstandard
+from pydantic import BaseModel
+from temporalio.api.common.v1 import Payload
+from temporalio.converter import (
+    CompositePayloadConverter,
+    DataConverter,
+    DefaultPayloadConverter,
+    JSONPlainPayloadConverter,
+    PayloadCodec,
+    value_to_type,
+)
+
+# 小于该阈值的Payload不压缩, 避免在小负载上得不偿失
+_COMPRESS_THRESHOLD_BYTES = 1024
+
+
+def _orjson_default(value: Any) -> Any:
+    """orjson不原生支持的类型的回退编码(主要是Pydantic模型)。"""
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    raise TypeError(f"Object of type {type(value)} is not JSON serializable")
+
+
+class OrjsonPayloadConverter(JSONPlainPayloadConverter):
+    """
+    用orjson进行JSON Payload编解码的转换器。
+    orjson的dumps比标准库快约2-3倍, 直接产出UTF-8字节,
+    降低每次Activity/子工作流负载序列化的CPU成本。
+    """
+
+    def to_payload(self, value: Any) -> Optional[Payload]:
+        return Payload(
+            metadata={"encoding": self.encoding.encode()},
+            data=orjson.dumps(value, default=_orjson_default),
+        )
+
+    def from_payload(self, payload: Payload, type_hint: Optional[Type] = None) -> Any:
+        obj = orjson.loads(payload.data)
+        if type_hint is not None:
+            obj = value_to_type(type_hint, obj)
+        return obj
+
+
+class CodeGenPayloadConverter(CompositePayloadConverter):
+    """默认的转换器链, 但JSON步骤替换为orjson实现。"""
+
+    def __init__(self) -> None:
+        super().__init__(
+            *(
+                OrjsonPayloadConverter()
+                if isinstance(converter, JSONPlainPayloadConverter)
+                else converter
+                for converter in DefaultPayloadConverter.default_encoding_payload_converters
+            )
+        )
+
+
+class ZstdPayloadCodec(PayloadCodec):
+    """
+    对超过阈值的Payload做zstd压缩的编解码器。
+    pytest的JSON测试报告可能很大且在每次重试/回放中被反复读取;
+    压缩同时降低事件历史的存储体积和Worker每个工作流任务的传输字节数。
+    """
+
+    def __init__(self) -> None:
+        self._compressor = zstandard.ZstdCompressor()
+        self._decompressor = zstandard.ZstdDecompressor()
+
+    async def encode(self, payloads: Sequence[Payload]) -> List[Payload]:
+        out: List[Payload] = []
+        for payload in payloads:
+            if len(payload.data) < _COMPRESS_THRESHOLD_BYTES:
+                out.append(payload)
+                continue
+            out.append(
+                Payload(
+                    metadata={"encoding": b"binary/zstd"},
+                    data=self._compressor.compress(payload.SerializeToString()),
+                )
+            )
+        return out
+
+    async def decode(self, payloads: Sequence[Payload]) -> List[Payload]:
+        out: List[Payload] = []
+        for payload in payloads:
+            if payload.metadata.get("encoding") != b"binary/zstd":
+                out.append(payload)
+                continue
+            inner = Payload()
+            inner.ParseFromString(self._decompressor.decompress(payload.data))
+            out.append(inner)
+        return out
+
+
+def make_data_converter() -> DataConverter:
+    """
+    构建DataConverter(orjson编码 + zstd压缩)。
+    Payload编解码必须在所有读写这些负载的进程间对称: Worker、UI以及
+    任何其他客户端都要用同一个converter连接, 否则一端压缩为binary/zstd
+    的结果/查询响应在另一端无法解码。
+    """
+    return DataConverter(
+        payload_converter_class=CodeGenPayloadConverter,
+        payload_codec=ZstdPayloadCodec(),
+    )
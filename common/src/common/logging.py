@@ -1,11 +1,79 @@
 # /common/src/common/logging.py
 
+import atexit
+import io
 import logging
+import logging.handlers
+import queue
 import sys
+import threading
+import time
 from typing import Any
 
+import orjson
 import structlog
 
+# stdout缓冲区大小(64KB)与周期性flush的间隔(秒)
+_STDOUT_BUFFER_SIZE = 65536
+_FLUSH_INTERVAL_SECONDS = 0.2
+
+
+def _orjson_serializer(obj: Any, **kwargs: Any) -> str:
+    """
+    使用orjson序列化日志记录。
+    orjson是C扩展, 直接将dict序列化为UTF-8字节, 比标准库json.dumps快约2倍,
+    且原生支持datetime/UUID等常见日志字段类型。
+    调用方传入的default优先; 否则用str兜底, 确保HttpUrl等类型也能被序列化。
+    """
+    return orjson.dumps(obj, default=kwargs.get("default", str)).decode()
+
+
+class _BufferedStreamHandler(logging.StreamHandler):
+    """
+    不在每条记录后flush的StreamHandler。
+    标准的StreamHandler.emit每条记录都调用flush(), 导致每行日志一次write(2)
+    系统调用; 这里依赖底层的BufferedWriter批量写出, 将系统调用摊销到多条记录上。
+    WARNING及以上级别的记录仍然立即flush, 保证关键日志的持久性。
+    """
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            msg = self.format(record)
+            self.stream.write(msg + self.terminator)
+            if record.levelno >= logging.WARNING:
+                self.flush()
+        except Exception:
+            self.handleError(record)
+
+
+class _PassthroughQueueHandler(logging.handlers.QueueHandler):
+    """
+    不在入队前格式化记录的QueueHandler。
+    stdlib的prepare()会用默认formatter预格式化: record.msg被替换成
+    str(record.msg)且exc_info被剥离——而structlog经由
+    ProcessorFormatter.wrap_for_formatter把事件dict放在record.msg里,
+    预格式化会让监听线程拿到dict的repr字符串, 结构化字段全部丢失。
+    完整的格式化(含异常信息)留给监听线程的Handler完成。
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def _start_flush_timer(handler: logging.Handler) -> None:
+    """启动一个守护线程, 周期性地flush缓冲区, 避免低流量时日志滞留。"""
+
+    def _flush_loop() -> None:
+        while True:
+            time.sleep(_FLUSH_INTERVAL_SECONDS)
+            try:
+                handler.flush()
+            except ValueError:
+                # 流已关闭(进程退出中), 结束线程
+                return
+
+    threading.Thread(target=_flush_loop, name="log-flush", daemon=True).start()
+
 
 def configure_logging(log_level: str = "INFO") -> None:
     """
@@ -22,8 +90,9 @@ def configure_logging(log_level: str = "INFO") -> None:
         structlog.stdlib.add_logger_name,
         # 添加日志级别
         structlog.stdlib.add_log_level,
-        # 添加ISO格式的时间戳
-        structlog.processors.TimeStamper(fmt="iso"),
+        # 添加原始的Unix时间戳(float): fmt=None只做一次time.time(),
+        # 避免每条记录的strftime/ISO字符串格式化开销, 由下游日志聚合器负责展示格式。
+        structlog.processors.TimeStamper(fmt=None, utc=True, key="ts"),
     ]
 
     structlog.configure(
@@ -40,16 +109,40 @@ def configure_logging(log_level: str = "INFO") -> None:
 
     # 配置标准的logging模块, 使其与structlog协同工作
     formatter = structlog.stdlib.ProcessorFormatter(
-        # 定义最终输出的处理器, 这里我们使用JSON格式
-        processor=structlog.processors.JSONRenderer(),
+        # 定义最终输出的处理器, 这里我们使用JSON格式(由orjson高速序列化)
+        processor=structlog.processors.JSONRenderer(serializer=_orjson_serializer),
         # 如果需要, 可以保留原始的`logging.LogRecord`字段
         foreign_pre_chain=shared_processors,
     )
 
-    handler = logging.StreamHandler(sys.stdout)
-    handler.setFormatter(formatter)
+    # 用64KB的BufferedWriter包装stdout, 将多条日志批量写出,
+    # 把每行一次的write(2)系统调用摊销为每批一次。
+    buffered_stdout = io.TextIOWrapper(
+        io.BufferedWriter(sys.stdout.buffer, buffer_size=_STDOUT_BUFFER_SIZE),
+        write_through=False,
+        line_buffering=False,
+    )
+
+    # 真正执行I/O和JSON序列化的Handler, 只在监听线程中运行
+    stream_handler = _BufferedStreamHandler(buffered_stdout)
+    stream_handler.setFormatter(formatter)
+    # 周期性flush, 保证低流量时日志也能及时出现; 进程退出时做最终flush
+    _start_flush_timer(stream_handler)
+    atexit.register(stream_handler.flush)
+
+    # 将日志调用与I/O解耦: 热路径上的logger调用只做一次无锁入队(微秒级),
+    # 写stdout的系统调用和格式化由单独的监听线程完成, 不会阻塞asyncio事件循环。
+    log_queue: queue.SimpleQueue[Any] = queue.SimpleQueue()
+    queue_handler = _PassthroughQueueHandler(log_queue)
+    listener = logging.handlers.QueueListener(
+        log_queue, stream_handler, respect_handler_level=True
+    )
+    listener.start()
+    # 进程退出时停止监听线程, 确保队列中剩余的日志被写出
+    atexit.register(listener.stop)
+
     root_logger = logging.getLogger()
-    root_logger.addHandler(handler)
+    root_logger.addHandler(queue_handler)
     root_logger.setLevel(log_level.upper())
 
     # 将关键库的日志级别调高, 以减少噪音
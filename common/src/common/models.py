@@ -1,13 +1,37 @@
 # /common/src/common/models.py
 
-from typing import Any, Dict, List, Optional
+from enum import IntEnum
+from typing import Any, Dict, Optional
 
-from pydantic import BaseModel, Field, HttpUrl
+from pydantic import BaseModel, ConfigDict, Field, HttpUrl, field_validator
+
+# stdout/stderr的结构化上限(64KB), 防止病态的超大输出拖垮JSON日志和序列化。
+# 超限时截断而不是拒绝: 超大输出是合法测试运行的正常产物, 不是校验错误。
+_OUTPUT_CAP_BYTES = 65536
+
+# 不可变模型的共享配置:
+# frozen=True启用哈希缓存并省去__setattr__上的校验开销,
+# extra="ignore"让pydantic-core跳过未知字段扫描。
+_FROZEN_CONFIG = ConfigDict(frozen=True, extra="ignore")
+
+
+class TestOutcome(IntEnum):
+    """
+    测试报告解析后的判定结果。
+    使用IntEnum而非字符串字面量: 比较是整数相等(而非字符串比较),
+    且在Temporal事件历史中只序列化为一个数字, 负载更小。
+    """
+
+    PASSED = 0
+    RETRYABLE_FAILURE = 1
+    TERMINAL_FAILURE = 2
 
 
 class TraceableRequest(BaseModel):
     """一个混入类(Mixin), 为服务间请求添加分布式追踪ID。"""
 
+    model_config = _FROZEN_CONFIG
+
     # trace_id用于关联一次完整请求在所有微服务间的日志。
     trace_id: Optional[str] = None
 
@@ -15,6 +39,8 @@ class TraceableRequest(BaseModel):
 class InitialRequest(BaseModel):
     """从Streamlit UI发送到编排器的初始请求。"""
 
+    model_config = _FROZEN_CONFIG
+
     functional_description: str = Field(
        ..., min_length=10, description="功能的详细文字描述"
     )
@@ -38,16 +64,46 @@ class SandboxRequest(TraceableRequest):
 class SandboxResponse(BaseModel):
     """沙箱服务返回的结构化测试报告。"""
 
+    model_config = _FROZEN_CONFIG
+
     summary: Dict[str, Any]
-    tests: List[Any]
+    # 使用朴素的list类型, 避免pydantic-core对大报告逐元素迭代Any校验器
+    tests: list
     # 增加了stdout和stderr字段, 用于捕获和返回更详细的执行输出, 便于调试。
     stdout: str
     stderr: str
     error: Optional[str] = None
 
+    @field_validator("stdout", "stderr", mode="before")
+    @classmethod
+    def _cap_output(cls, value: Any) -> Any:
+        """把超长输出钳制到上限, 保留开头(错误摘要通常在前)。"""
+        if isinstance(value, str) and len(value) > _OUTPUT_CAP_BYTES:
+            return value[:_OUTPUT_CAP_BYTES]
+        return value
+
+
+class AgentSpawnInput(BaseModel):
+    """
+    启动Agent子工作流所需的差异化字段。
+    共享的InitialRequest作为独立参数传递, 不再嵌入每个子工作流的Start负载
+    而被重复序列化; continue_as_new时借助本模型携带迭代进度。
+    """
+
+    model_config = _FROZEN_CONFIG
+
+    agent_id: str
+    model_endpoint_env_var: str
+    current_iteration: int = 0
+    faulty_code: Optional[str] = None
+    test_errors: Optional[Dict[str, Any]] = None
+
 
 class AgentState(BaseModel):
-    """代表单个智能体工作流的完整状态, 用于在Temporal工作流中传递。"""
+    """
+    代表单个智能体工作流的完整状态, 用于在Temporal工作流中传递。
+    注意: 该模型在FSM循环中被原地更新(current_iteration等), 因此不能冻结。
+    """
 
     agent_id: str
     # 从具体URL改为环境变量名, 增强灵活性和安全性
@@ -64,6 +120,8 @@ class AgentState(BaseModel):
 class FinalOutput(BaseModel):
     """向UI呈现的最终成功或失败报告。"""
 
+    model_config = _FROZEN_CONFIG
+
     status: str
     message: str
     workflow_id: str
@@ -80,6 +138,8 @@ class FinalOutput(BaseModel):
 class AgentStatus(BaseModel):
     """用于查询Agent工作流当前状态的数据模型。"""
 
+    model_config = _FROZEN_CONFIG
+
     agent_id: str
     current_iteration: int
     max_iterations: int
@@ -90,6 +150,24 @@ class AgentStatus(BaseModel):
 class MainWorkflowStatus(BaseModel):
     """用于查询主Saga工作流当前状态的数据模型。"""
 
+    model_config = _FROZEN_CONFIG
+
     status: str  # e.g., "RUNNING", "SUCCESS", "FAILED"
     agent_a_status: Optional[AgentStatus] = None
-    agent_b_status: Optional[AgentStatus] = None
\ No newline at end of file
+    agent_b_status: Optional[AgentStatus] = None
+
+
+# 在导入时强制编译所有模型的pydantic-core Schema,
+# 把构建成本摊销到进程启动阶段, 消除Worker首次执行工作流时的冷路径尖峰。
+for _model in (
+    TraceableRequest,
+    InitialRequest,
+    SandboxRequest,
+    SandboxResponse,
+    AgentSpawnInput,
+    AgentState,
+    FinalOutput,
+    AgentStatus,
+    MainWorkflowStatus,
+):
+    _model.model_rebuild(force=True)
\ No newline at end of file
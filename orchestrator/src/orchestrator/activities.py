@@ -1,37 +1,124 @@
 # /orchestrator/src/orchestrator/activities.py
 
+import asyncio
+import logging
 import os
+from functools import lru_cache
 from typing import Any, Dict, Tuple
 import httpx
-from common.models import AgentState, SandboxRequest, SandboxResponse
+import orjson
+from common.models import AgentState, SandboxResponse, TestOutcome
+from pydantic import TypeAdapter
 from temporalio import activity
 from .config import get_settings
 
 settings = get_settings()
 
-http_client = httpx.AsyncClient(timeout=30.0)
+# 在导入时把HttpUrl转成字符串并拼接好端点, 避免每次Activity调用都重新字符串化。
+# rstrip('/')处理HttpUrl规范化后自带的尾部斜杠, 防止产生双斜杠路径。
+SANDBOX_EXECUTE_URL = f"{str(settings.sandbox_url).rstrip('/')}/execute_tests"
+
+# 基础HTTP头部作为模块常量, 每次调用只需在其上合并trace_id
+_HEADERS_JSON = {"Content-Type": "application/json"}
+
+
+def _info(msg: str, **kwargs: Any) -> None:
+    """
+    仅在INFO级别启用时才记录日志。
+    生产环境中若INFO被过滤, 此守卫可跳过事件字典构建和处理器链的全部开销。
+    """
+    if activity.logger.isEnabledFor(logging.INFO):
+        activity.logger.info(msg, **kwargs)
+
+
+def _encode_sandbox_request(code: str, test_files_url: str, trace_id: str) -> bytes:
+    """
+    为出站的沙箱请求手工生成JSON字节。
+    SandboxRequest只有三个字段, 构建完整的Pydantic实例再model_dump_json
+    是多余的: 这里用orjson对每个字符串做转义后直接拼接, 完全跳过校验器图。
+    SandboxRequest模型仍保留, 用于入站方向的校验。
+    """
+    return (
+        b'{"code_to_test":'
+        + orjson.dumps(code)
+        + b',"test_files_url":'
+        + orjson.dumps(test_files_url)
+        + b',"trace_id":'
+        + orjson.dumps(trace_id)
+        + b"}"
+    )
 
-@activity.defn
-async def generate_code(prompt: str, model_endpoint_env_var: str) -> str:
-    """Activity: 调用外部大语言模型服务生成代码。"""
-    model_endpoint = os.getenv(model_endpoint_env_var)
-    if not model_endpoint:
+
+@lru_cache(maxsize=32)
+def _resolve_endpoint(env_var: str) -> str:
+    """
+    解析并缓存模型端点环境变量。
+    端点在进程生命周期内不会变化, 缓存后热路径上只剩一次lru_cache命中。
+    """
+    endpoint = os.environ.get(env_var)
+    if not endpoint:
         # 如果环境变量未设置，则抛出不可重试的错误。
-        raise ValueError(f"Environment variable {model_endpoint_env_var} not set.")
+        raise ValueError(f"Environment variable {env_var} not set.")
+    return endpoint
 
-    activity.logger.info(
-        "Generating code using model endpoint.",
-        model_endpoint_env_var=model_endpoint_env_var,
-    )
+# 提示词模板在模块级别构建一次, 每次调用只做参数填充, 避免重复解析f-string
+_REFINE_PROMPT_TEMPLATE = """
+The original task was: {task}
 
-    headers = {"Content-Type": "application/json"}
+The following code was generated but failed the tests:
+```python
+{code}
+```
+
+The test execution failed with the following results:
+{errors}
+
+Based on the test errors, please provide a corrected version of the Python code.
+Only output the raw Python code, without any explanations or markdown formatting.
+"""
+
+# 共享的异步HTTP客户端:
+# - http2=True让多个并发Activity的请求复用同一条TCP连接(多路复用),
+#   省去每次调用的TCP/TLS握手开销;
+# - 显式调大连接池上限, 避免大量Activity同时发请求时在默认池(100/20)上争抢。
+# 共享的TypeAdapter缓存了编译好的pydantic-core校验Schema,
+# 避免每次解析测试报告时重建校验器查找路径。
+_SANDBOX_RESPONSE_ADAPTER: TypeAdapter[SandboxResponse] = TypeAdapter(SandboxResponse)
+
+http_client = httpx.AsyncClient(
+    http2=True,
+    limits=httpx.Limits(
+        max_connections=256,
+        max_keepalive_connections=64,
+        keepalive_expiry=60.0,
+    ),
+    timeout=httpx.Timeout(connect=5.0, read=30.0, write=30.0, pool=5.0),
+)
+
+
+async def close_http_client() -> None:
+    """关闭共享的HTTP客户端, 在Worker关停时调用以干净地释放套接字。"""
+    await http_client.aclose()
+
+@activity.defn
+async def generate_code(prompt: str, model_endpoint_env_var: str) -> str:
+    """Activity: 调用外部大语言模型服务生成代码。"""
+    model_endpoint = _resolve_endpoint(model_endpoint_env_var)
 
     try:
+        # 预先用orjson编码请求体, 避免httpx在客户端内部用标准库json再序列化一次;
+        # 响应同样用orjson解码原始字节。
         response = await http_client.post(
-            model_endpoint, json={"prompt": prompt}, headers=headers
+            model_endpoint, content=orjson.dumps({"prompt": prompt}), headers=_HEADERS_JSON
         )
         response.raise_for_status()
-        return response.json()["generated_code"]
+        # 单条合并日志: 一次处理器链开销携带整个调用的全部信息
+        _info(
+            "llm_call_done",
+            model_endpoint_env_var=model_endpoint_env_var,
+            status=response.status_code,
+        )
+        return orjson.loads(response.content)["generated_code"]
     except httpx.HTTPStatusError as e:
         activity.logger.error(
             "HTTP error while calling LLM service.",
@@ -50,83 +137,96 @@ async def run_tests_in_sandbox(
     code: str, test_files_url: str, trace_id: str
 ) -> Dict[str, Any]:
     """Activity: 调用沙箱微服务以安全地执行代码和测试。"""
-    activity.logger.info("Running tests in sandbox...")
-    request_data = SandboxRequest(
-        code_to_test=code,
-        test_files_url=test_files_url,
-        trace_id=trace_id,
-    )
     # 将 trace_id 作为 HTTP 头部传递，用于分布式追踪。
-    headers = {
-        "Content-Type": "application/json",
-        "X-Trace-ID": trace_id,
-    }
+    headers = {**_HEADERS_JSON, "X-Trace-ID": trace_id}
     try:
-        response = await http_client.post(
-            f"{settings.SANDBOX_URL}/execute_tests",
-            json=request_data.model_dump(mode="json"),
+        # 使用流式请求: 响应体按需读取, 不在事件循环线程上做整体缓冲+解析。
+        async with http_client.stream(
+            "POST",
+            SANDBOX_EXECUTE_URL,
+            content=_encode_sandbox_request(code, test_files_url, trace_id),
             headers=headers,
             timeout=180.0,
+        ) as response:
+            response.raise_for_status()
+            raw = await response.aread()
+        # 单条合并日志替代调用前后的多次日志, 减半结构化日志量
+        _info(
+            "sandbox_done",
+            status=response.status_code,
+            bytes=len(raw),
+            trace_id=trace_id,
         )
-        response.raise_for_status()
-        return response.json()
+        # JSON解析是CPU操作, 用orjson在线程中完成, 保持asyncio循环的响应性
+        return await asyncio.to_thread(orjson.loads, raw)
     except httpx.RequestError as e:
         activity.logger.error("Failed to connect to sandbox service.", exc_info=True)
         raise ConnectionError("Could not connect to the sandbox service.") from e
 
-@activity.defn
-async def parse_test_results(report: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
-    """Activity: 解析沙箱返回的测试报告，判断最终结果。"""
-    activity.logger.info("Parsing test results...")
-    sandbox_response = SandboxResponse(**report)
-
-    if sandbox_response.error:
+@activity.defn(no_thread_cancel_exception=True)
+async def parse_test_results(
+    report: Dict[str, Any]
+) -> Tuple[TestOutcome, Dict[str, Any]]:
+    """
+    Activity: 解析沙箱返回的测试报告，判断最终结果。
+    纯CPU操作(字典读取), 由工作流以*本地Activity*方式调用,
+    在Worker进程内执行, 省去任务队列分发和额外的历史事件。
+    """
+    # 热路径上只做O(1)的字典读取: 决策仅依赖error和summary,
+    # 对包含成千上万条测试记录的报告做整体Pydantic校验是不必要的开销。
+    error = report.get("error")
+    summary = report.get("summary") or {}
+
+    # 仅在DEBUG级别才做完整的结构校验, 用于排查沙箱返回格式问题
+    if activity.logger.isEnabledFor(logging.DEBUG):
+        _SANDBOX_RESPONSE_ADAPTER.validate_python(report)
+
+    if error:
         activity.logger.error(
             "Sandbox reported a terminal execution error.",
-            error=sandbox_response.error,
+            error=error,
         )
-        return "TERMINAL_FAILURE", {"error": sandbox_response.error}
+        return TestOutcome.TERMINAL_FAILURE, {"error": error}
 
-    summary = sandbox_response.summary
     if summary and summary.get("failed", 0) > 0:
         activity.logger.warning("Tests failed.", summary=summary)
         # 测试失败，但可以重试。返回完整报告供后续步骤使用。
-        return "RETRYABLE_FAILURE", report
+        return TestOutcome.RETRYABLE_FAILURE, report
 
     if summary and summary.get("passed", 0) > 0:
-        activity.logger.info("Tests passed.", summary=summary)
-        return "PASSED", report
+        _info("Tests passed.", summary=summary)
+        return TestOutcome.PASSED, report
 
     activity.logger.error("Unknown test outcome.", summary=summary)
-    return "TERMINAL_FAILURE", {"error": "Unknown test outcome", "summary": summary}
+    return TestOutcome.TERMINAL_FAILURE, {
+        "error": "Unknown test outcome",
+        "summary": summary,
+    }
 
-@activity.defn
+@activity.defn(no_thread_cancel_exception=True)
 async def refine_prompt(state: AgentState) -> str:
-    """Activity: 根据失败的测试结果，生成一个用于代码修正的、更精确的提示。"""
-    activity.logger.info(f"Refining prompt for agent {state.agent_id}...")
-    original_prompt = state.initial_request.functional_description
-    error_summary = str(state.test_errors)
-
-    return f"""
-The original task was: {original_prompt}
-
-The following code was generated but failed the tests:
-```python
-{state.faulty_code}
-```
-
-The test execution failed with the following results:
-{error_summary}
+    """
+    Activity: 根据失败的测试结果，生成一个用于代码修正的、更精确的提示。
+    纯CPU操作(字符串格式化), 由工作流以*本地Activity*方式调用。
+    """
+    _info(f"Refining prompt for agent {state.agent_id}...")
+    # 用orjson序列化错误信息: 比str(dict)的Python-repr遍历更快,
+    # 且输出的是标准JSON, 对模型更易解析。
+    errors_json = (
+        orjson.dumps(state.test_errors).decode() if state.test_errors else "{}"
+    )
 
-Based on the test errors, please provide a corrected version of the Python code.
-Only output the raw Python code, without any explanations or markdown formatting.
-"""
+    return _REFINE_PROMPT_TEMPLATE.format(
+        task=state.initial_request.functional_description,
+        code=state.faulty_code or "",
+        errors=errors_json,
+    )
 
 @activity.defn
 async def cleanup_successful_agent_artifacts(agent_id: str) -> None:
     """Saga 补偿操作: 清理成功 Agent 留下的产物。此操作必须是幂等的。"""
-    activity.logger.info(
+    _info(
         f"Executing compensation: Cleaning up artifacts for successful agent {agent_id}..."
     )
     # 此处应包含实际的清理逻辑，例如从对象存储中删除文件。
-    activity.logger.info(f"Cleanup for agent {agent_id} complete (simulated).")
\ No newline at end of file
+    _info(f"Cleanup for agent {agent_id} complete (simulated).")
\ No newline at end of file
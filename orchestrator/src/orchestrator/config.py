@@ -1,9 +1,9 @@
 # /orchestrator/src/orchestrator/config.py
 
-from functools import lru_cache
+from functools import cached_property, lru_cache
 
 from common.config import AppBaseSettings
-from pydantic import HttpUrl
+from pydantic import Field, HttpUrl
 
 
 class OrchestratorSettings(AppBaseSettings):
@@ -11,11 +11,25 @@ class OrchestratorSettings(AppBaseSettings):
 
     TEMPORAL_SERVER: str = "localhost:7233"
     TASK_QUEUE: str = "code-generation-task-queue"
-    SANDBOX_URL: HttpUrl = "http://localhost:8000"
+    # 保存原始字符串, HttpUrl校验推迟到首次访问sandbox_url时才执行,
+    # 使Settings实例化近乎零成本, 也为未来的secrets后端预留惰性加载模式。
+    SANDBOX_URL: str = Field(default="http://localhost:8000", validate_default=False)
     # 定义模型端点的环境变量名, 而不是硬编码URL, 增强灵活性和安全性
     VLLM_MODEL_A_ENV_VAR: str = "VLLM_MODEL_A_URL"
     VLLM_MODEL_B_ENV_VAR: str = "VLLM_MODEL_B_URL"
 
+    # Worker并发调优:
+    # Activity以长时间的沙箱/LLM调用为主, 限制并发数避免打满下游;
+    # 调大工作流粘性缓存, 缓存命中可跳过完整历史回放。
+    MAX_CONCURRENT_ACTIVITIES: int = 32
+    MAX_CONCURRENT_WORKFLOW_TASKS: int = 100
+    MAX_CACHED_WORKFLOWS: int = 5000
+
+    @cached_property
+    def sandbox_url(self) -> HttpUrl:
+        """惰性校验并缓存SANDBOX_URL, 只在首次访问时解析URL。"""
+        return HttpUrl(self.SANDBOX_URL)
+
 
 @lru_cache
 def get_settings() -> OrchestratorSettings:
@@ -3,19 +3,14 @@
 import asyncio
 
 from common.logging import configure_logging, get_logger
-from temporalio.client import Client
-from temporalio.worker import Worker
-
-from .activities import (
-    cleanup_successful_agent_artifacts,
-    generate_code,
-    parse_test_results,
-    refine_prompt,
-    run_tests_in_sandbox,
-)
+
+# uvloop在个别平台(如Windows)上不可用; 缺失时回退到标准asyncio循环
+try:
+    import uvloop
+except ImportError:
+    uvloop = None  # type: ignore[assignment]
+
 from .config import get_settings
-from .workflows.agent_workflow import AgentFSMWorkflow
-from .workflows.main_workflow import MainSagaWorkflow
 
 # 在模块级别获取配置和日志记录器
 settings = get_settings()
@@ -26,9 +21,29 @@ log = get_logger(__name__)
 
 async def main() -> None:
     """主函数, 用于连接Temporal, 并启动Worker。"""
+    # 延迟导入重量级依赖(temporalio、Activity与工作流模块及其传递依赖):
+    # 自动扩缩容时, 冷启动时间直接决定新Worker拾取首个任务的延迟。
+    from temporalio.client import Client
+    from temporalio.worker import Worker
+
+    from .activities import (
+        cleanup_successful_agent_artifacts,
+        close_http_client,
+        generate_code,
+        parse_test_results,
+        refine_prompt,
+        run_tests_in_sandbox,
+    )
+    from common.converter import make_data_converter
+    from .workflows.agent_workflow import AgentFSMWorkflow
+    from .workflows.main_workflow import MainSagaWorkflow
+
     try:
         # 使用从配置中获取的地址连接到Temporal服务器
-        client = await Client.connect(settings.TEMPORAL_SERVER)
+        # 使用orjson负载转换器, 降低每个Payload的序列化成本
+        client = await Client.connect(
+            settings.TEMPORAL_SERVER, data_converter=make_data_converter()
+        )
         log.info(
             "Successfully connected to Temporal server.",
             server_address=settings.TEMPORAL_SERVER,
@@ -47,6 +62,10 @@ async def main() -> None:
                 refine_prompt,
                 cleanup_successful_agent_artifacts,
             ],
+            # 显式设置并发上限与粘性缓存大小, 而不是依赖SDK默认值
+            max_concurrent_activities=settings.MAX_CONCURRENT_ACTIVITIES,
+            max_concurrent_workflow_tasks=settings.MAX_CONCURRENT_WORKFLOW_TASKS,
+            max_cached_workflows=settings.MAX_CACHED_WORKFLOWS,
         )
         log.info("Worker started.", task_queue=settings.TASK_QUEUE)
         await worker.run()
@@ -54,10 +73,18 @@ async def main() -> None:
         log.error("Worker failed to start or run.", exc_info=True)
         # 在生产环境中, 这里可能需要一个重启策略或告警机制
         raise
+    finally:
+        # 关停时干净地关闭共享HTTP客户端的连接池
+        await close_http_client()
 
 
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
+        # uvloop(基于libuv的C实现)将每次await的调度开销降低约2-4倍,
+        # 对I/O密集的Activity(httpx POST)有直接的吞吐提升。
+        if uvloop is not None:
+            uvloop.run(main())
+        else:
+            asyncio.run(main())
     except KeyboardInterrupt:
         log.info("Worker shutting down gracefully.")
\ No newline at end of file
@@ -3,7 +3,13 @@
 from datetime import timedelta
 from typing import Dict, Optional
 
-from common.models import AgentState, AgentStatus
+from common.models import (
+    AgentSpawnInput,
+    AgentState,
+    AgentStatus,
+    InitialRequest,
+    TestOutcome,
+)
 from temporalio import activity, workflow
 from temporalio.common import RetryPolicy
 from temporalio.exceptions import ApplicationError
@@ -27,14 +33,16 @@ run_tests_in_sandbox = activity.create(
         backoff_coefficient=2.0,
     ),
 )
-parse_test_results = activity.create(
-    name="parse_test_results",
-    start_to_close_timeout=timedelta(seconds=30),
-)
-refine_prompt = activity.create(
-    name="refine_prompt",
-    start_to_close_timeout=timedelta(minutes=2),
-)
+# 去相关抖动退避的参数(秒)
+_BACKOFF_BASE_SECONDS = 1.0
+_BACKOFF_CAP_SECONDS = 60.0
+
+# 历史事件数阈值: 超过后通过continue_as_new重置历史, 保证回放成本有界
+_HISTORY_LENGTH_LIMIT = 10_000
+
+# parse_test_results和refine_prompt是纯CPU操作,
+# 以本地Activity(execute_local_activity)方式在调用点直接执行,
+# 省去任务队列分发、gRPC往返和额外的历史事件(2条 vs ~5条)。
 
 
 @workflow.defn
@@ -43,63 +51,122 @@ class AgentFSMWorkflow:
         self._state: Optional[AgentState] = None
         self._status: str = "PENDING"
         self._last_test_summary: Dict = {}
+        # 查询结果缓存: UI可能有多个观察者高频轮询get_status,
+        # 状态未变化时直接复用上一次构建的AgentStatus对象
+        self._status_cache: Optional[AgentStatus] = None
+        self._status_dirty: bool = True
+
+    async def _set_status(self, status: str) -> None:
+        """更新FSM状态, 使查询缓存失效, 并将快照推送给父工作流。"""
+        if status == self._status:
+            # 状态未变化时不产生signal, 避免冗余的历史事件
+            return
+        self._status = status
+        self._status_dirty = True
+        await self._push_status_to_parent()
+
+    async def _push_status_to_parent(self) -> None:
+        """
+        向父工作流signal推送最新的AgentStatus快照。
+        推送只在状态变化时发生(每次迭代常数次), 让父工作流的get_status
+        成为纯本地读取, 替代每次轮询的跨工作流查询RPC。
+        """
+        parent = workflow.info().parent
+        if parent is None:
+            return
+        handle = workflow.get_external_workflow_handle(parent.workflow_id)
+        await handle.signal(
+            "on_child_status", args=[self._state.agent_id, self.get_status()]
+        )
 
     @workflow.run
-    async def execute(self, state: AgentState) -> str:
+    async def execute(
+        self, request: InitialRequest, spawn: AgentSpawnInput, trace_id: str
+    ) -> str:
         """执行有限状态机(FSM)工作流, 用于单个Agent的代码生成和测试循环。"""
-        self._state = state
+        # 在子工作流内部重建完整状态: 父工作流只传差异化的spawn字段,
+        # 共享的InitialRequest不再在每个Start负载中重复嵌入完整AgentState。
+        self._state = AgentState(
+            agent_id=spawn.agent_id,
+            model_endpoint_env_var=spawn.model_endpoint_env_var,
+            trace_id=trace_id,
+            current_iteration=spawn.current_iteration,
+            max_iterations=request.max_iterations,
+            initial_request=request,
+            faulty_code=spawn.faulty_code,
+            test_errors=spawn.test_errors,
+        )
+        self._status_dirty = True
+        # 热循环中反复使用的不变量绑定为局部变量, 避免每次迭代重复的
+        # 属性链查找和Pydantic URL的__str__调用(URL类型在字符串化时会再校验)
+        agent_id = self._state.agent_id
+        model_env = self._state.model_endpoint_env_var
+        test_url = str(request.test_files_url)
+        initial_desc = request.functional_description
+        # 结构化日志: 变量部分作为键值对传递, 被过滤的记录不付字符串构造成本
         workflow.logger.info(
-            f"[{self._state.agent_id}] FSM workflow started.",
-            trace_id=self._state.trace_id,
+            "fsm_started", agent_id=agent_id, trace_id=self._state.trace_id
         )
 
-        for i in range(self._state.max_iterations):
+        prev_delay = _BACKOFF_BASE_SECONDS
+        # 从current_iteration继续: continue_as_new重启后保留已完成的迭代数
+        for i in range(self._state.current_iteration, self._state.max_iterations):
             self._state.current_iteration = i + 1
+            self._status_dirty = True
             workflow.logger.info(
-                f"[{self._state.agent_id}] Starting iteration "
-                f"{self._state.current_iteration}/{self._state.max_iterations}."
+                "iteration_start",
+                agent_id=agent_id,
+                iteration=self._state.current_iteration,
+                max_iterations=self._state.max_iterations,
             )
 
             # 1. 状态: 生成或优化提示
-            self._status = (
+            await self._set_status(
                 "REFINING_PROMPT" if self._state.faulty_code else "GENERATING_CODE"
             )
             if self._state.faulty_code:
-                prompt = await refine_prompt(self._state)
+                prompt = await workflow.execute_local_activity(
+                    "refine_prompt",
+                    self._state,
+                    start_to_close_timeout=timedelta(minutes=2),
+                )
             else:
-                prompt = self._state.initial_request.functional_description
+                prompt = initial_desc
 
             # 2. 状态: 生成代码
-            self._status = "GENERATING_CODE"
-            generated_code = await generate_code(
-                prompt, self._state.model_endpoint_env_var
-            )
+            await self._set_status("GENERATING_CODE")
+            generated_code = await generate_code(prompt, model_env)
             self._state.faulty_code = generated_code
 
             # 3. 状态: 在沙箱中运行测试
-            self._status = "TESTING"
+            await self._set_status("TESTING")
             test_report_dict = await run_tests_in_sandbox(
-                generated_code,
-                str(self._state.initial_request.test_files_url),
-                self._state.trace_id,
+                generated_code, test_url, trace_id
             )
             self._last_test_summary = test_report_dict.get("summary", {})
+            self._status_dirty = True
 
             # 4. 状态: 解析测试结果
-            self._status = "PARSING_RESULTS"
-            outcome, report_details = await parse_test_results(test_report_dict)
+            await self._set_status("PARSING_RESULTS")
+            outcome, report_details = await workflow.execute_local_activity(
+                "parse_test_results",
+                test_report_dict,
+                start_to_close_timeout=timedelta(seconds=30),
+            )
 
-            if outcome == "PASSED":
-                self._status = "SUCCESS"
+            # 整数相等比较, 比字符串字面量比较更快且历史负载更小
+            if outcome == TestOutcome.PASSED:
+                await self._set_status("SUCCESS")
                 workflow.logger.info(
-                    f"[{self._state.agent_id}] Tests passed on attempt {self._state.current_iteration}."
+                    "tests_passed",
+                    agent_id=agent_id,
+                    iteration=self._state.current_iteration,
                 )
                 return generated_code
-            elif outcome == "TERMINAL_FAILURE":
-                self._status = "FAILED"
+            elif outcome == TestOutcome.TERMINAL_FAILURE:
+                await self._set_status("FAILED")
                 workflow.logger.error(
-                    f"[{self._state.agent_id}] Terminal failure detected.",
-                    details=report_details,
+                    "terminal_failure", agent_id=agent_id, details=report_details
                 )
                 raise ApplicationError(
                     f"[{self._state.agent_id}] Unrecoverable error in code or tests.",
@@ -108,17 +175,49 @@ class AgentFSMWorkflow:
             else:  # RETRYABLE_FAILURE
                 self._state.test_errors = report_details
                 workflow.logger.warning(
-                    f"[{self._state.agent_id}] Retriable failure on attempt {self._state.current_iteration}."
+                    "retryable_failure",
+                    agent_id=agent_id,
+                    iteration=self._state.current_iteration,
+                )
+                # 去相关抖动退避: 纯2**i指数会让同一上游故障后的所有Agent
+                # 同时醒来再次冲击vLLM/沙箱(惊群); 抖动将重试分散在退避窗口内。
+                # workflow.random()以run-id为种子, 回放安全, 不可使用stdlib random。
+                delay_seconds = min(
+                    _BACKOFF_CAP_SECONDS,
+                    workflow.random().uniform(
+                        _BACKOFF_BASE_SECONDS,
+                        max(_BACKOFF_BASE_SECONDS, prev_delay * 3),
+                    ),
                 )
-                # 使用确定性的指数退避延迟
-                delay_seconds = 2**i
+                prev_delay = delay_seconds
                 workflow.logger.info(
-                    f"[{self._state.agent_id}] Sleeping for {delay_seconds} seconds before next attempt."
+                    "retry_sleep", agent_id=agent_id, delay_seconds=delay_seconds
                 )
                 # 必须使用 workflow.sleep 来保证确定性
                 await workflow.sleep(delay_seconds)
 
-        self._status = "FAILED"
+                # 每次迭代追加约6-10条历史事件; 当服务端建议或历史过长时,
+                # 携带当前状态continue_as_new, 以空历史、相同ID重启工作流。
+                info = workflow.info()
+                if (
+                    info.is_continue_as_new_suggested()
+                    or info.get_current_history_length() > _HISTORY_LENGTH_LIMIT
+                ):
+                    workflow.continue_as_new(
+                        args=[
+                            request,
+                            AgentSpawnInput(
+                                agent_id=self._state.agent_id,
+                                model_endpoint_env_var=self._state.model_endpoint_env_var,
+                                current_iteration=self._state.current_iteration,
+                                faulty_code=self._state.faulty_code,
+                                test_errors=self._state.test_errors,
+                            ),
+                            trace_id,
+                        ]
+                    )
+
+        await self._set_status("FAILED")
         raise ApplicationError(
             f"[{self._state.agent_id}] Max iterations ({self._state.max_iterations}) reached.",
             non_retryable=True,
@@ -126,19 +225,26 @@ class AgentFSMWorkflow:
 
     @workflow.query
     def get_status(self) -> AgentStatus:
-        """提供工作流当前状态的只读视图。"""
+        """提供工作流当前状态的只读视图。状态未变化时返回缓存的对象。"""
+        if self._status_cache is not None and not self._status_dirty:
+            return self._status_cache
+
         if not self._state:
-            return AgentStatus(
+            status = AgentStatus(
                 agent_id="N/A",
                 current_iteration=0,
                 max_iterations=0,
                 status=self._status,
                 last_test_summary={},
             )
-        return AgentStatus(
-            agent_id=self._state.agent_id,
-            current_iteration=self._state.current_iteration,
-            max_iterations=self._state.max_iterations,
-            status=self._status,
-            last_test_summary=self._last_test_summary,
-        )
\ No newline at end of file
+        else:
+            status = AgentStatus(
+                agent_id=self._state.agent_id,
+                current_iteration=self._state.current_iteration,
+                max_iterations=self._state.max_iterations,
+                status=self._status,
+                last_test_summary=self._last_test_summary,
+            )
+        self._status_cache = status
+        self._status_dirty = False
+        return status
\ No newline at end of file
@@ -3,10 +3,11 @@
 import asyncio
 import uuid
 from datetime import timedelta
-from typing import List
+from typing import Any, Dict, List
 
 from common.models import (
-    AgentState,
+    AgentSpawnInput,
+    AgentStatus,
     FinalOutput,
     InitialRequest,
     MainWorkflowStatus,
@@ -25,6 +26,10 @@ class MainSagaWorkflow:
         self._agent_a_handle: workflow.ChildWorkflowHandle | None = None
         self._agent_b_handle: workflow.ChildWorkflowHandle | None = None
         self._trace_id: str = ""
+        # 子工作流通过signal推送的状态镜像: 查询时只做本地读取, 无RPC扇出
+        self._child_statuses: Dict[str, AgentStatus] = {}
+        # 每个子工作流的结局(结果值或异常), 在首次gather时填充
+        self._child_results: Dict[str, Any] = {}
 
     @workflow.run
     async def execute(self, request: InitialRequest) -> FinalOutput:
@@ -45,41 +50,64 @@ class MainSagaWorkflow:
         model_a_env_var = settings.get("VLLM_MODEL_A_ENV_VAR", "VLLM_MODEL_A_URL")
         model_b_env_var = settings.get("VLLM_MODEL_B_ENV_VAR", "VLLM_MODEL_B_URL")
 
-        agent_a_state = AgentState(
-            agent_id="agent_a",
-            model_endpoint_env_var=model_a_env_var,
-            trace_id=self._trace_id,
-            max_iterations=request.max_iterations,
-            initial_request=request,
+        # 只传差异化的spawn字段; 共享的InitialRequest作为独立参数传递,
+        # 避免两个Start负载各自嵌入一份近乎相同的完整AgentState。
+        spawn_a = AgentSpawnInput(
+            agent_id="agent_a", model_endpoint_env_var=model_a_env_var
         )
-        agent_b_state = AgentState(
-            agent_id="agent_b",
-            model_endpoint_env_var=model_b_env_var,
-            trace_id=self._trace_id,
-            max_iterations=request.max_iterations,
-            initial_request=request,
+        spawn_b = AgentSpawnInput(
+            agent_id="agent_b", model_endpoint_env_var=model_b_env_var
         )
 
-        try:
-            # 并行启动两个子工作流
-            self._agent_a_handle = workflow.start_child_workflow(
-                AgentFSMWorkflow.execute,
-                agent_a_state,
-                id=f"agent-a-{self._trace_id}",
-                parent_close_policy=ParentClosePolicy.TERMINATE,
-            )
-            self._agent_b_handle = workflow.start_child_workflow(
-                AgentFSMWorkflow.execute,
-                agent_b_state,
-                id=f"agent-b-{self._trace_id}",
-                parent_close_policy=ParentClosePolicy.TERMINATE,
-            )
+        # 并行启动两个子工作流
+        self._agent_a_handle = workflow.start_child_workflow(
+            AgentFSMWorkflow.execute,
+            args=[request, spawn_a, self._trace_id],
+            id=f"agent-a-{self._trace_id}",
+            parent_close_policy=ParentClosePolicy.TERMINATE,
+        )
+        self._agent_b_handle = workflow.start_child_workflow(
+            AgentFSMWorkflow.execute,
+            args=[request, spawn_b, self._trace_id],
+            id=f"agent-b-{self._trace_id}",
+            parent_close_policy=ParentClosePolicy.TERMINATE,
+        )
 
-            # 等待两个子工作流的结果
-            result_a, result_b = await asyncio.gather(
-                self._agent_a_handle, self._agent_b_handle
+        # 首个子工作流失败时立即短路: 不再等另一个Agent跑满max_iterations,
+        # 而是取消它, 尽早开始Saga补偿并释放沙箱/模型容量。
+        task_a = asyncio.ensure_future(self._agent_a_handle)
+        task_b = asyncio.ensure_future(self._agent_b_handle)
+        done, pending = await asyncio.wait(
+            [task_a, task_b], return_when=asyncio.FIRST_EXCEPTION
+        )
+        if any(task.exception() is not None for task in done):
+            for task in pending:
+                # Temporal会将取消传播为子工作流的取消请求
+                task.cancel()
+
+        # 收集两个子工作流的最终结局(结果值或异常, 包括取消),
+        # 缓存到self._child_results —— 之后的所有判断都是本地查找。
+        results = await asyncio.gather(task_a, task_b, return_exceptions=True)
+        self._child_results = dict(zip(("agent_a", "agent_b"), results))
+
+        # 选取根因: 跳过CancelledError —— 它是我们对另一个Agent的连带取消,
+        # 不是失败原因; 按(agent_a, agent_b)顺序盲取会在agent_b先失败时
+        # 把agent_a的取消当作failure, 丢掉真正的cause。
+        failure = next(
+            (
+                r
+                for r in results
+                if isinstance(r, BaseException)
+                and not isinstance(r, asyncio.CancelledError)
+            ),
+            None,
+        )
+        if failure is None:
+            # 兜底: 两个结局都是取消(例如父工作流被取消)时仍需报告失败
+            failure = next(
+                (r for r in results if isinstance(r, BaseException)), None
             )
-
+        if failure is None:
             self._status = "SUCCESS"
             workflow.logger.info("Both agents succeeded.", trace_id=self._trace_id)
             return FinalOutput(
@@ -87,94 +115,64 @@ class MainSagaWorkflow:
                 message="Both agents succeeded.",
                 workflow_id=workflow.info().workflow_id,
                 trace_id=self._trace_id,
-                code_a=result_a,
-                code_b=result_b,
-            )
-        except ChildWorkflowFailure as e:
-            # 当任何一个子工作流失败时, 进入Saga补偿逻辑
-            self._status = "FAILED_AND_ROLLING_BACK"
-            workflow.logger.error(
-                f"A child workflow failed: {e.cause}", trace_id=self._trace_id
+                code_a=self._child_results["agent_a"],
+                code_b=self._child_results["agent_b"],
             )
 
-            # 检查哪个Agent成功了, 并为其执行补偿操作
-            compensations: List[workflow.ActivityHandle] = []
-            if self._agent_a_handle:
-                try:
-                    # 检查Agent A是否成功
-                    await self._agent_a_handle.result()
-                    workflow.logger.info(
-                        "Agent A succeeded, scheduling compensation.",
-                        trace_id=self._trace_id,
-                    )
-                    compensations.append(
-                        workflow.execute_activity(
-                            "cleanup_successful_agent_artifacts",
-                            "agent_a",
-                            start_to_close_timeout=timedelta(minutes=1),
-                        )
-                    )
-                except ChildWorkflowFailure:
-                    # Agent A失败了, 不需要补偿
-                    pass
-            if self._agent_b_handle:
-                try:
-                    # 检查Agent B是否成功
-                    await self._agent_b_handle.result()
-                    workflow.logger.info(
-                        "Agent B succeeded, scheduling compensation.",
-                        trace_id=self._trace_id,
-                    )
-                    compensations.append(
-                        workflow.execute_activity(
-                            "cleanup_successful_agent_artifacts",
-                            "agent_b",
-                            start_to_close_timeout=timedelta(minutes=1),
-                        )
-                    )
-                except ChildWorkflowFailure:
-                    # Agent B失败了, 不需要补偿
-                    pass
-
-            if compensations:
-                # 使用gather确保所有补偿操作都会被尝试, 即使其中一个失败
-                await asyncio.gather(*compensations, return_exceptions=True)
-                workflow.logger.info(
-                    "All compensations executed.", trace_id=self._trace_id
-                )
+        # 当任何一个子工作流失败时, 进入Saga补偿逻辑
+        self._status = "FAILED_AND_ROLLING_BACK"
+        cause = failure.cause if isinstance(failure, ChildWorkflowFailure) else failure
+        workflow.logger.error(
+            f"A child workflow failed: {cause}", trace_id=self._trace_id
+        )
 
-            self._status = "ROLLED_BACK"
-            return FinalOutput(
-                status="ROLLED_BACK",
-                message=f"Workflow failed and was rolled back. Reason: {e.cause}",
-                workflow_id=workflow.info().workflow_id,
+        # 结局已缓存: 只为成功的Agent调度补偿操作, 无需再探测子工作流
+        compensations: List[workflow.ActivityHandle] = []
+        for agent_id, result in self._child_results.items():
+            if isinstance(result, BaseException):
+                # 该Agent失败了, 不需要补偿
+                continue
+            workflow.logger.info(
+                f"Agent {agent_id} succeeded, scheduling compensation.",
                 trace_id=self._trace_id,
             )
-
-    @workflow.query
-    async def get_status(self) -> MainWorkflowStatus:
-        """提供主工作流及其所有子工作流的层级状态。"""
-        agent_a_status = None
-        if self._agent_a_handle:
-            try:
-                agent_a_status = await self._agent_a_handle.query(
-                    AgentFSMWorkflow.get_status
+            compensations.append(
+                workflow.execute_activity(
+                    "cleanup_successful_agent_artifacts",
+                    agent_id,
+                    start_to_close_timeout=timedelta(minutes=1),
                 )
-            except Exception:
-                # 如果查询失败(例如, 子工作流已完成), 则忽略
-                pass
-
-        agent_b_status = None
-        if self._agent_b_handle:
-            try:
-                agent_b_status = await self._agent_b_handle.query(
-                    AgentFSMWorkflow.get_status
-                )
-            except Exception:
-                pass
+            )
+
+        if compensations:
+            # 使用gather确保所有补偿操作都会被尝试, 即使其中一个失败
+            await asyncio.gather(*compensations, return_exceptions=True)
+            workflow.logger.info(
+                "All compensations executed.", trace_id=self._trace_id
+            )
+
+        self._status = "ROLLED_BACK"
+        return FinalOutput(
+            status="ROLLED_BACK",
+            message=f"Workflow failed and was rolled back. Reason: {cause}",
+            workflow_id=workflow.info().workflow_id,
+            trace_id=self._trace_id,
+        )
+
+    @workflow.signal
+    def on_child_status(self, agent_id: str, status: AgentStatus) -> None:
+        """接收子工作流在状态变化时推送的快照。"""
+        self._child_statuses[agent_id] = status
 
+    @workflow.query
+    def get_status(self) -> MainWorkflowStatus:
+        """
+        提供主工作流及其所有子工作流的层级状态。
+        子工作流状态由signal推送镜像到本地, 查询是纯O(1)读取:
+        不再对每次轮询发起两次跨工作流查询RPC, 也不会阻塞子工作流的任务循环。
+        """
         return MainWorkflowStatus(
             status=self._status,
-            agent_a_status=agent_a_status,
-            agent_b_status=agent_b_status,
+            agent_a_status=self._child_statuses.get("agent_a"),
+            agent_b_status=self._child_statuses.get("agent_b"),
         )
\ No newline at end of file
@@ -4,13 +4,25 @@ from functools import lru_cache
 
 from common.config import AppBaseSettings
 from pydantic import Field
+from pydantic_settings import SettingsConfigDict
 
 
 class SandboxSettings(AppBaseSettings):
-    """Sandbox服务的特定配置。"""
+    """
+    Sandbox服务的特定配置。
+    注意: 请始终通过get_settings()获取实例 —— 直接实例化SandboxSettings()
+    会绕过缓存, 每次都重新解析环境变量并重跑Pydantic校验。
+    """
+
+    # frozen=True使实例不可变且可哈希; 其余配置继承自AppBaseSettings
+    model_config = SettingsConfigDict(
+        case_sensitive=False, env_file=".env", frozen=True
+    )
 
     # 关键安全配置: 指定要连接的Docker守护进程地址。
-    # 在生产环境中, 这应该指向隔离的DinD服务。
+    # 在生产环境中, 这应该指向隔离的DinD服务(tcp://dind:2375)。
+    # 也支持unix:///var/run/docker.sock: 与守护进程同机部署时,
+    # UNIX socket绕过TCP协议栈, 是每请求开销最低的传输方式。
     DOCKER_HOST: str
 
     # 用于执行测试的Docker镜像标签
@@ -19,8 +31,36 @@ class SandboxSettings(AppBaseSettings):
     # 在沙箱容器内执行测试的最大超时时间(秒)
     SANDBOX_EXECUTION_TIMEOUT: int = Field(default=60, gt=0, le=300)
 
+    # 沙箱容器的CPU相对权重(CFS shares)。刻意只暴露相对权重而不是
+    # cpus/cpu_quota等硬限制: 硬配额会在pytest的import密集启动阶段触发
+    # CFS节流, 产生显著的延迟长尾; 相对权重允许借用主机空闲CPU突发。
+    SANDBOX_CPU_SHARES: int = Field(default=1024, ge=2, le=262144)
+
+    # 容器内的最大进程数。要容得下pytest-xdist的-n auto工作进程
+    # (每核一个)加上被测代码自身的子进程; 过紧的上限会让测试收集阶段
+    # 直接EAGAIN, 迫使用户退回串行执行。
+    SANDBOX_PIDS_LIMIT: int = Field(default=512, ge=16, le=4096)
+
+    # 同时在DinD上运行的沙箱上限。这是显式的并发旋钮(应与DinD主机的
+    # CPU数对齐), 取代了原先线程池隐式的~40并发上限; 超出的请求在
+    # 信号量上排队而不是占用线程。
+    SANDBOX_MAX_CONCURRENT: int = Field(default=16, ge=1, le=256)
+
+    # 预热容器池的大小。每个池容器以sleep infinity常驻, 测试通过exec注入,
+    # 省去每请求的容器create/start/remove; 设为0可回退到一次性容器模式。
+    SANDBOX_POOL_SIZE: int = Field(default=4, ge=0, le=64)
+
+    # 测试文件解压的临时目录。默认指向tmpfs(/dev/shm):
+    # 解包变成纯内存写入, 省去小文件落盘的块设备IO和元数据更新。
+    SANDBOX_SCRATCH_DIR: str = "/dev/shm"
+
 
 @lru_cache
 def get_settings() -> SandboxSettings:
-    """获取并缓存Sandbox的配置实例。"""
+    """
+    获取并缓存Sandbox的配置实例。
+    缓存是进程级的: pre-fork部署时应在父进程导入阶段调用一次,
+    让子进程通过写时复制继承缓存实例; 运行时修改环境变量后
+    需要调用get_settings.cache_clear()才会重新解析。
+    """
     return SandboxSettings()
\ No newline at end of file
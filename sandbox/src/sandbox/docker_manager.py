@@ -2,22 +2,53 @@
 
 import asyncio
 import os
-import io
-import json
+import queue
 import shutil
 import tarfile
 import tempfile
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Dict, Optional, Tuple
 
-import docker
+import aiodocker
 import httpx
-from docker.errors import ContainerError, DockerException
-from docker.models.containers import Container
+import orjson
+from aiodocker.exceptions import DockerError
 
 from.config import SandboxSettings
 
 
+class _ChunkStream:
+    """
+    把异步下载的字节块桥接为tarfile可读的同步流。
+    下载协程通过feed()推入块, 解包线程通过read()按需消费:
+    网络接收与解包重叠进行, 且任意时刻只驻留一个块, 而不是整个tar包。
+    """
+
+    def __init__(self) -> None:
+        self._chunks: queue.SimpleQueue[Optional[bytes]] = queue.SimpleQueue()
+        self._buffer = b""
+        self._eof = False
+
+    def feed(self, chunk: bytes) -> None:
+        self._chunks.put(chunk)
+
+    def feed_eof(self) -> None:
+        self._chunks.put(None)
+
+    def read(self, size: int = -1) -> bytes:
+        while not self._eof and (size < 0 or len(self._buffer) < size):
+            chunk = self._chunks.get()
+            if chunk is None:
+                self._eof = True
+                break
+            self._buffer += chunk
+        if size < 0:
+            data, self._buffer = self._buffer, b""
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
 class SandboxExecutionError(Exception):
     """自定义异常, 用于表示沙箱执行期间的错误。"""
 
@@ -30,121 +61,392 @@ class SandboxExecutionError(Exception):
 class SandboxManager:
     def __init__(self, settings: SandboxSettings) -> None:
         self.settings = settings
-        try:
-            # 关键安全变更: 连接到由配置指定的、隔离的Docker守护进程
-            self.client = docker.DockerClient(base_url=self.settings.DOCKER_HOST)
-            # 验证与Docker守护进程的连接
-            self.client.ping()
-        except DockerException as e:
-            # 如果无法连接到Docker守护进程, 这是一个致命错误
-            raise RuntimeError(
-                f"Failed to connect to Docker daemon at {self.settings.DOCKER_HOST}"
-            ) from e
+        # 关键安全变更: 连接到由配置指定的、隔离的Docker守护进程。
+        # aiodocker直接在事件循环上与Docker Engine API通信:
+        # 每个沙箱运行不再占用一个线程池线程等待容器结束,
+        # 并发上限由DinD侧资源决定, 而不是Starlette默认的~40线程。
+        # 连接的有效性在应用startup事件中通过version()验证。
+        self.client = aiodocker.Docker(url=self.settings.DOCKER_HOST)
+        # 共享的HTTP客户端: keep-alive连接池在所有沙箱运行间复用,
+        # 将TCP/TLS握手成本摊销掉(每次下载节省约1-2个RTT)。
+        # 上限按测试文件服务器的承载能力设置。
+        self._http = httpx.AsyncClient(
+            timeout=30.0,
+            limits=httpx.Limits(max_keepalive_connections=32, max_connections=64),
+            follow_redirects=True,
+        )
+        # 预热容器池(见start_pool); None表示未启用, 回退到每请求建容器
+        self._pool: Optional[
+            asyncio.Queue[Tuple[aiodocker.containers.DockerContainer, Path]]
+        ] = None
+        # 限制同时压在DinD上的沙箱数; 事件循环可以承载任意多的在途请求,
+        # 真正的瓶颈(DinD主机资源)用显式信号量约束
+        self._sem = asyncio.Semaphore(settings.SANDBOX_MAX_CONCURRENT)
+
+    async def start_pool(self) -> None:
+        """
+        预热SANDBOX_POOL_SIZE个常驻容器(sleep infinity), 在应用startup时调用。
+        每次测试复用池中容器并通过exec执行pytest, 省去每请求200-800ms的
+        create/start和~100ms的remove; 池为空时请求在Queue上排队, 形成天然背压。
+        """
+        if self.settings.SANDBOX_POOL_SIZE <= 0:
+            return
+        pool: asyncio.Queue[
+            Tuple[aiodocker.containers.DockerContainer, Path]
+        ] = asyncio.Queue()
+        for _ in range(self.settings.SANDBOX_POOL_SIZE):
+            pool.put_nowait(await self._create_pooled_container())
+        self._pool = pool
+
+    def _host_config(self, workdir: Path) -> Dict[str, Any]:
+        """沙箱容器共用的HostConfig(安全加固+资源限制)。"""
+        return {
+            "Binds": [f"{workdir}:/home/appuser/app:rw"],
+            # --- 安全加固 ---
+            "NetworkMode": "none",  # 禁用网络, 防止代码进行外部调用
+            "Memory": 512 * 1024 * 1024,  # 限制内存使用(512m)
+            "PidsLimit": self.settings.SANDBOX_PIDS_LIMIT,  # 防止fork炸弹
+            "ReadonlyRootfs": True,  # 将容器文件系统设为只读
+            # ----------------
+            # 只读根文件系统下为pytest的缓存和临时文件提供tmpfs:
+            # 否则.pytest_cache/__pycache__的写入会直接EROFS
+            "Tmpfs": {
+                "/tmp": "size=64m,mode=1777",
+                "/home/appuser/.cache": "size=64m",
+            },
+            # 只设置CpuShares(相对权重), 刻意不设CpuQuota/NanoCpus:
+            # 硬性CFS配额会在pytest约1-2秒的import密集启动阶段触发节流,
+            # 造成10倍级的延迟长尾; 相对权重允许借用DinD主机的空闲CPU突发。
+            "CpuShares": self.settings.SANDBOX_CPU_SHARES,
+        }
+
+    async def _create_pooled_container(
+        self,
+    ) -> Tuple["aiodocker.containers.DockerContainer", Path]:
+        """创建一个绑定独立tmpfs工作目录的常驻沙箱容器。"""
+        workdir = Path(tempfile.mkdtemp(dir=self.settings.SANDBOX_SCRATCH_DIR))
+        container = await self.client.containers.run(
+            config={
+                "Image": self.settings.SANDBOX_TEST_IMAGE_TAG,
+                # 常驻进程: 容器保持运行, 测试通过exec注入
+                "Cmd": ["sleep", "infinity"],
+                "User": "appuser",
+                "WorkingDir": "/home/appuser/app",
+                # 与一次性容器完全相同的安全加固与资源限制
+                "HostConfig": self._host_config(workdir),
+            }
+        )
+        return container, workdir
+
+    async def close(self) -> None:
+        """释放容器池、HTTP连接池与Docker客户端, 在应用shutdown时调用。"""
+        if self._pool is not None:
+            while not self._pool.empty():
+                container, workdir = self._pool.get_nowait()
+                try:
+                    await container.delete(force=True)
+                except DockerError:
+                    pass
+                shutil.rmtree(workdir, ignore_errors=True)
+            self._pool = None
+        await self._http.aclose()
+        await self.client.close()
 
     async def run_sandboxed_test(
         self, code_to_test: str, test_files_url: str
     ) -> Dict[str, Any]:
-        """
-        异步地在沙箱中运行测试。
-        使用asyncio.to_thread在单独的线程中运行同步的IO密集型代码,
-        避免阻塞FastAPI的事件循环。
-        """
-        return await asyncio.to_thread(
-            self._run_sync, code_to_test, test_files_url
+        """异步地在沙箱中运行测试, 全程不阻塞事件循环。"""
+        async with self._sem:
+            if self._pool is not None:
+                return await self._run_pooled(code_to_test, test_files_url)
+            return await self._run_single_use(code_to_test, test_files_url)
+
+    async def _run_pooled(
+        self, code_to_test: str, test_files_url: str
+    ) -> Dict[str, Any]:
+        """从池中取出常驻容器, 通过exec执行测试后清空工作目录归还。"""
+        assert self._pool is not None
+        container, workdir = await self._pool.get()
+        healthy = True
+        try:
+            await self._prepare_environment(workdir, code_to_test, test_files_url)
+            return await self._exec_pytest(container, workdir)
+        except (DockerError, asyncio.TimeoutError) as e:
+            # exec超时后pytest可能仍在容器内运行, 容器状态不再可信
+            healthy = False
+            raise SandboxExecutionError(f"Container error: {e}") from e
+        except SandboxExecutionError:
+            raise
+        except Exception as e:
+            raise SandboxExecutionError(f"An unexpected error occurred: {e}") from e
+        finally:
+            if healthy:
+                await asyncio.to_thread(self._wipe_workdir, workdir)
+                self._pool.put_nowait((container, workdir))
+            else:
+                await self._retire_container(container, workdir)
+
+    async def _exec_pytest(
+        self, container: "aiodocker.containers.DockerContainer", workdir: Path
+    ) -> Dict[str, Any]:
+        """在常驻容器内通过exec运行pytest, 收集demux后的输出与报告。"""
+        exec_ = await container.exec(
+            cmd=[
+                "pytest",
+                # xdist按核数并行执行, 测试套件墙钟时间线性缩短
+                "-n",
+                "auto",
+                "--json-report",
+                "--json-report-file=report.json",
+            ],
+            user="appuser",
+            workdir="/home/appuser/app",
+            stdout=True,
+            stderr=True,
+        )
+        stdout_buf = bytearray()
+        stderr_buf = bytearray()
+        async with asyncio.timeout(self.settings.SANDBOX_EXECUTION_TIMEOUT):
+            async with exec_.start(detach=False) as stream:
+                while True:
+                    message = await stream.read_out()
+                    if message is None:
+                        break
+                    buf = stderr_buf if message.stream == 2 else stdout_buf
+                    buf.extend(message.data)
+        inspection = await exec_.inspect()
+        exit_code = inspection.get("ExitCode", 1)
+        return self._load_report(
+            workdir,
+            exit_code if exit_code is not None else 1,
+            stdout_buf.decode("utf-8", errors="ignore"),
+            stderr_buf.decode("utf-8", errors="ignore"),
         )
 
-    def _run_sync(self, code_to_test: str, test_files_url: str) -> Dict[str, Any]:
-        """同步的测试执行逻辑。"""
-        temp_dir = tempfile.mkdtemp()
-        container: Container | None = None
+    async def _retire_container(
+        self, container: "aiodocker.containers.DockerContainer", workdir: Path
+    ) -> None:
+        """丢弃状态可疑的容器并尽力补充一个新容器入池。"""
+        try:
+            await container.delete(force=True)
+        except DockerError:
+            pass
+        shutil.rmtree(workdir, ignore_errors=True)
+        assert self._pool is not None
+        try:
+            self._pool.put_nowait(await self._create_pooled_container())
+        except (DockerError, OSError):
+            # 补充失败时池缩小一位; 守护进程恢复后可通过重启服务恢复池容量
+            pass
+
+    @staticmethod
+    def _wipe_workdir(path: Path) -> None:
+        """清空工作目录内容但保留目录本身(它是bind mount的源)。"""
+        for entry in path.iterdir():
+            if entry.is_dir() and not entry.is_symlink():
+                shutil.rmtree(entry)
+            else:
+                entry.unlink()
+
+    async def _run_single_use(
+        self, code_to_test: str, test_files_url: str
+    ) -> Dict[str, Any]:
+        """每请求一个一次性容器的回退路径(SANDBOX_POOL_SIZE=0时)。"""
+        # 临时目录建在tmpfs上(见SANDBOX_SCRATCH_DIR):
+        # 解压的测试文件和report.json都不经过块设备
+        temp_dir = tempfile.mkdtemp(dir=self.settings.SANDBOX_SCRATCH_DIR)
+        container: aiodocker.containers.DockerContainer | None = None
         try:
             temp_path = Path(temp_dir)
-            self._prepare_environment_sync(temp_path, code_to_test, test_files_url)
-
-            container = self.client.containers.run(
-                image=self.settings.SANDBOX_TEST_IMAGE_TAG,
-                command=["pytest", "--json-report", "--json-report-file=report.json"],
-                volumes={str(temp_path): {"bind": "/home/appuser/app", "mode": "rw"}},
-                working_dir="/home/appuser/app",
-                user="appuser",
-                # --- 安全加固 ---
-                network_mode="none",  # 禁用网络, 防止代码进行外部调用
-                mem_limit="512m",  # 限制内存使用
-                pids_limit=100,  # 限制进程数量, 防止fork炸弹
-                read_only=True,  # 将容器文件系统设为只读
-                # ----------------
-                detach=True,
-            )
-            result = container.wait(timeout=self.settings.SANDBOX_EXECUTION_TIMEOUT)
-            exit_code = result.get("StatusCode", 1)
+            await self._prepare_environment(temp_path, code_to_test, test_files_url)
 
-            stdout = container.logs(stdout=True, stderr=False).decode(
-                "utf-8", errors="ignore"
+            container = await self.client.containers.run(
+                config={
+                    "Image": self.settings.SANDBOX_TEST_IMAGE_TAG,
+                    "Cmd": [
+                        "pytest",
+                        # xdist按核数并行执行, 测试套件墙钟时间线性缩短
+                        "-n",
+                        "auto",
+                        "--json-report",
+                        "--json-report-file=report.json",
+                    ],
+                    "User": "appuser",
+                    "WorkingDir": "/home/appuser/app",
+                    "HostConfig": self._host_config(temp_path),
+                }
             )
-            stderr = container.logs(stdout=False, stderr=True).decode(
-                "utf-8", errors="ignore"
+            # 超时由asyncio.wait_for控制: aiodocker的wait只是一个长轮询HTTP
+            # 请求, 它超时并不会终止容器本身
+            result = await asyncio.wait_for(
+                container.wait(), timeout=self.settings.SANDBOX_EXECUTION_TIMEOUT
             )
+            exit_code = result.get("StatusCode", 1)
 
             report_path = temp_path / "report.json"
-            if report_path.exists():
-                with open(report_path, "r") as f:
-                    report_data = json.load(f)
-                # 将stdout和stderr附加到报告中, 以便上游服务进行调试
-                report_data["stdout"] = stdout
-                report_data["stderr"] = stderr
-                return report_data
-            else:
+            if not report_path.exists():
+                # 只有报告缺失的失败路径才回源拉容器日志
+                stdout, stderr = await self._fetch_logs(container)
                 raise SandboxExecutionError(
                     f"report.json not found. Exit code: {exit_code}.",
                     stdout=stdout,
                     stderr=stderr,
                 )
-        except ContainerError as e:
+            # 成功路径不再调用logs: pytest-json-report已经捕获了每个测试的
+            # 输出, 从报告合成stdout/stderr, 省去重复的字节传输和守护进程IO
+            # orjson的C解析器比stdlib json快2-5倍, 报告大时差异显著
+            report_data = orjson.loads(report_path.read_bytes())
+            stdout, stderr = self._synthesize_output(report_data)
+            report_data["stdout"] = stdout
+            report_data["stderr"] = stderr
+            return report_data
+        except SandboxExecutionError:
+            raise
+        except asyncio.TimeoutError as e:
+            # 超时的容器还在运行: 显式SIGKILL, 不能只依赖finally中的
+            # delete(force=True) —— 失败时它会把僵尸沙箱留在DinD上积累
+            if container:
+                try:
+                    await container.kill(signal="SIGKILL")
+                except DockerError:
+                    pass
+                stdout, stderr = await self._fetch_logs(container)
+            else:
+                stdout = stderr = ""
             raise SandboxExecutionError(
-                f"Container error: {e.stderr.decode('utf-8', errors='ignore')}",
-                stdout=e.stdout.decode("utf-8", errors="ignore") if e.stdout else "",
-                stderr=e.stderr.decode("utf-8", errors="ignore") if e.stderr else "",
+                f"Sandbox execution timed out after "
+                f"{self.settings.SANDBOX_EXECUTION_TIMEOUT}s.",
+                stdout=stdout,
+                stderr=stderr,
             ) from e
-        except Exception as e:
+        except DockerError as e:
+            # 容器的输出附加到错误上, 便于上游诊断崩溃
             stdout = stderr = ""
             if container:
-                stdout = container.logs(stdout=True, stderr=False).decode(
-                    "utf-8", errors="ignore"
-                )
-                stderr = container.logs(stdout=False, stderr=True).decode(
-                    "utf-8", errors="ignore"
-                )
+                stdout, stderr = await self._fetch_logs(container)
             raise SandboxExecutionError(
-                f"An unexpected error occurred: {e}", stdout, stderr
+                f"Container error: {e}", stdout=stdout, stderr=stderr
             ) from e
+        except Exception as e:
+            raise SandboxExecutionError(f"An unexpected error occurred: {e}") from e
         finally:
             if container:
                 try:
-                    container.remove(force=True)
-                except docker.errors.NotFound:
+                    await container.delete(force=True)
+                except DockerError:
+                    # 容器可能已被守护进程回收
                     pass
             shutil.rmtree(temp_dir)
 
-    def _prepare_environment_sync(self, path: Path, code: str, url: str) -> None:
+    @staticmethod
+    def _load_report(
+        path: Path, exit_code: int, stdout: str, stderr: str
+    ) -> Dict[str, Any]:
+        """读取pytest的report.json并附加stdout/stderr, 便于上游调试。"""
+        report_path = path / "report.json"
+        if not report_path.exists():
+            raise SandboxExecutionError(
+                f"report.json not found. Exit code: {exit_code}.",
+                stdout=stdout,
+                stderr=stderr,
+            )
+        # orjson的C解析器比stdlib json快2-5倍, 报告大时差异显著
+        report_data = orjson.loads(report_path.read_bytes())
+        report_data["stdout"] = stdout
+        report_data["stderr"] = stderr
+        return report_data
+
+    @staticmethod
+    def _synthesize_output(report_data: Dict[str, Any]) -> Tuple[str, str]:
+        """从报告的per-test捕获中合成stdout/stderr, 免去再拉容器日志。"""
+        stdout_parts = []
+        stderr_parts = []
+        for test in report_data.get("tests", []):
+            for phase in ("setup", "call", "teardown"):
+                section = test.get(phase)
+                if not section:
+                    continue
+                if section.get("stdout"):
+                    stdout_parts.append(section["stdout"])
+                if section.get("stderr"):
+                    stderr_parts.append(section["stderr"])
+        return "".join(stdout_parts), "".join(stderr_parts)
+
+    @staticmethod
+    async def _fetch_logs(
+        container: "aiodocker.containers.DockerContainer",
+    ) -> Tuple[str, str]:
+        """
+        通过单个attach流回放容器的全部输出(仅失败路径调用)。
+        Docker的流协议在每帧头部标记来源(1=stdout, 2=stderr),
+        在这里demux到两个缓冲区; 读取失败时返回已收集的部分。
+        """
+        stdout_buf = bytearray()
+        stderr_buf = bytearray()
+        try:
+            async with container.attach(
+                stdout=True, stderr=True, logs=True
+            ) as stream:
+                while True:
+                    message = await stream.read_out()
+                    if message is None:
+                        break
+                    buf = stderr_buf if message.stream == 2 else stdout_buf
+                    buf.extend(message.data)
+        except DockerError:
+            pass
+        return (
+            stdout_buf.decode("utf-8", errors="ignore"),
+            stderr_buf.decode("utf-8", errors="ignore"),
+        )
+
+    async def _prepare_environment(self, path: Path, code: str, url: str) -> None:
         """准备执行测试所需的文件环境。"""
-        (path / "solution.py").write_text(code, encoding="utf-8")
+        # 先写临时名再os.replace: rename在内核层面是原子的,
+        # 容器内的pytest不可能读到半写入的solution.py
+        tmp = path / "solution.py.tmp"
+        tmp.write_bytes(code.encode("utf-8"))
+        os.replace(tmp, path / "solution.py")
+        # 流式下载+解包: 解包线程边收边解, 不再将完整tar包物化到内存
+        stream = _ChunkStream()
+        extract_task = asyncio.create_task(
+            asyncio.to_thread(self._extract_archive, path, stream)
+        )
+        download_error: Optional[Exception] = None
         try:
-            with httpx.Client() as client:
-                response = client.get(url, follow_redirects=True, timeout=30.0)
+            async with self._http.stream("GET", url) as response:
                 response.raise_for_status()
-            with tarfile.open(fileobj=io.BytesIO(response.content), mode="r:*") as tar:
-                # 优化: 逐个安全地解压成员
-                for member in tar.getmembers():
+                async for chunk in response.aiter_bytes():
+                    stream.feed(chunk)
+        except httpx.HTTPError as e:
+            download_error = e
+        finally:
+            stream.feed_eof()
+        if download_error is not None:
+            # 下载失败时tar流被截断, 解包线程的TarError只是连带症状:
+            # 等它结束但以下载错误为准上报
+            try:
+                await extract_task
+            except SandboxExecutionError:
+                pass
+            raise SandboxExecutionError(
+                f"Failed to download test files from {url}"
+            ) from download_error
+        await extract_task
+
+    @staticmethod
+    def _extract_archive(path: Path, fileobj: _ChunkStream) -> None:
+        """以流式模式(r|*)安全地将测试文件tar包解压到目标目录。"""
+        try:
+            with tarfile.open(fileobj=fileobj, mode="r|*") as tar:
+                # 流式迭代成员: 读到一个成员的头和数据就立即解压
+                for member in tar:
                     member_path = os.path.join(path, member.name)
                     # 安全检查：确保解压路径在目标目录内
                     if not os.path.abspath(member_path).startswith(os.path.abspath(path)):
                         raise SandboxExecutionError(f"Malicious tar file detected: {member.name}")
                     tar.extract(member, path=path)
-        except httpx.RequestError as e:
-            raise SandboxExecutionError(
-                f"Failed to download test files from {url}"
-            ) from e
         except tarfile.TarError as e:
             raise SandboxExecutionError(
                 "Failed to extract test files. Ensure it's a valid tar archive."
-            ) from e
\ No newline at end of file
+            ) from e
@@ -6,37 +6,53 @@ from typing import Any, Callable, Dict
 import structlog
 from common.logging import configure_logging, get_logger
 from common.models import SandboxRequest, SandboxResponse
-from fastapi import Depends, FastAPI, HTTPException, Request, Response, status
-from starlette.middleware.base import BaseHTTPMiddleware
+from fastapi import Depends, FastAPI, HTTPException, Response, status
+from fastapi.responses import ORJSONResponse
 
 from.config import get_settings
 from.docker_manager import SandboxExecutionError, SandboxManager
 
+# 配置在模块导入时解析一次为常量: 后续所有使用(日志、DI、startup)
+# 都直接引用, 不再经过get_settings()的调用与缓存查找
+SETTINGS = get_settings()
+
 # 在应用启动时配置日志
-configure_logging(get_settings().LOG_LEVEL)
+configure_logging(SETTINGS.LOG_LEVEL)
 log = get_logger(__name__)
 
-app = FastAPI(title="Secure Code Execution Sandbox")
+# ORJSONResponse用C级序列化输出所有响应: 带有大段stdout/stderr的
+# 测试报告不再走纯Python的json.dumps, CPU开销与负载大小成正比地下降
+app = FastAPI(
+    title="Secure Code Execution Sandbox",
+    default_response_class=ORJSONResponse,
+)
 
 
 # 使用lru_cache实现单例模式, 确保SandboxManager只被实例化一次
 @lru_cache
 def get_sandbox_manager() -> SandboxManager:
-    return SandboxManager(settings=get_settings())
-
-
-# 新增: 用于分布式追踪的中间件
-class LoggingMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        # 清除上一个请求可能留下的上下文
-        structlog.contextvars.clear_contextvars()
-        # 从请求头中获取trace_id
-        trace_id = request.headers.get("X-Trace-ID")
-        if trace_id:
-            # 将trace_id绑定到日志上下文中
-            structlog.contextvars.bind_contextvars(trace_id=trace_id)
-        response = await call_next(request)
-        return response
+    return SandboxManager(settings=SETTINGS)
+
+
+# 用于分布式追踪的中间件。
+# 纯ASGI实现: BaseHTTPMiddleware会为每个请求fork一个anyio任务并缓冲
+# 流式响应体, 带来约30-50%的额外开销; 直接实现ASGI可调用对象则没有。
+class LoggingMiddleware:
+    def __init__(self, app: Callable) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Dict, receive: Callable, send: Callable) -> None:
+        if scope["type"] == "http":
+            # 清除上一个请求可能留下的上下文
+            structlog.contextvars.clear_contextvars()
+            # 从请求头中获取trace_id并绑定到日志上下文中
+            for name, value in scope["headers"]:
+                if name == b"x-trace-id":
+                    structlog.contextvars.bind_contextvars(
+                        trace_id=value.decode("latin-1")
+                    )
+                    break
+        await self.app(scope, receive, send)
 
 
 app.add_middleware(LoggingMiddleware)
@@ -50,17 +66,46 @@ async def startup_event() -> None:
     """
     log.info(
         "Sandbox service starting up.",
-        settings=get_settings().model_dump(),
+        settings=SETTINGS.model_dump(),
     )
     # 预热Docker客户端连接
     try:
-        get_sandbox_manager().client.ping()
+        await get_sandbox_manager().client.version()
         log.info("Successfully connected to Docker daemon.")
     except Exception:
         log.error("Failed to connect to Docker daemon on startup.", exc_info=True)
         # 在生产环境中, 这应该导致服务启动失败
         raise
 
+    # 预热测试镜像: 把镜像层下载从首个请求的关键路径挪到进程启动阶段,
+    # 避免冷启动的第一个/execute_tests调用额外等待数秒的pull
+    client = get_sandbox_manager().client
+    try:
+        await client.images.inspect(SETTINGS.SANDBOX_TEST_IMAGE_TAG)
+        log.info("Test image already present.", image=SETTINGS.SANDBOX_TEST_IMAGE_TAG)
+    except Exception:
+        try:
+            await client.images.pull(SETTINGS.SANDBOX_TEST_IMAGE_TAG)
+            log.info("Test image pulled.", image=SETTINGS.SANDBOX_TEST_IMAGE_TAG)
+        except Exception:
+            # 本地构建的镜像可能不在registry中; 留给首次运行时由守护进程解析
+            log.warning(
+                "Failed to pre-pull test image.",
+                image=SETTINGS.SANDBOX_TEST_IMAGE_TAG,
+                exc_info=True,
+            )
+
+    # 预热容器池: 后续请求通过exec复用常驻容器, 不再为每个请求付出
+    # 容器create/start/remove的固定开销
+    await get_sandbox_manager().start_pool()
+    log.info("Sandbox container pool ready.", pool_size=SETTINGS.SANDBOX_POOL_SIZE)
+
+
+@app.on_event("shutdown")
+async def shutdown_event() -> None:
+    """应用关停时释放SandboxManager持有的连接池。"""
+    await get_sandbox_manager().close()
+
 
 @app.post(
     "/execute_tests", response_model=SandboxResponse, status_code=status.HTTP_200_OK
@@ -100,8 +145,13 @@ async def execute_tests_endpoint(
         )
 
 
+# 健康检查的响应体预先编码为常量: 编排系统每秒一次的liveness/readiness
+# 探针不经过Pydantic校验和JSON序列化, 每次探测零分配
+_HEALTH_BYTES = b'{"status":"ok"}'
+
+
 # 新增: 健康检查端点
 @app.get("/health", status_code=status.HTTP_200_OK)
-def health_check() -> Dict[str, str]:
+async def health_check() -> Response:
     """提供给容器编排系统(如Docker Compose, Kubernetes)的健康检查端点。"""
-    return {"status": "ok"}
\ No newline at end of file
+    return Response(content=_HEALTH_BYTES, media_type="application/json")
\ No newline at end of file
@@ -1,22 +1,32 @@
 # /ui/src/ui/app.py
 
-import asyncio
-import time
 import uuid
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Optional, Tuple
 
 import streamlit as st
 from common.models import InitialRequest, MainWorkflowStatus
 from diff_match_patch import diff_match_patch
-from temporalio.client import WorkflowHandle
+from temporalio.client import WorkflowExecutionStatus, WorkflowHandle
 from temporalio.exceptions import WorkflowFailureError
 
-from.temporal_client import get_temporal_client, start_workflow
+from.temporal_client import (
+    bridge_async,
+    get_temporal_client,
+    get_workflow_id_prefix,
+    iter_workflow_events,
+    run_on_temporal_loop,
+    start_workflow,
+)
 
 
+# 缓存diff结果: Myers算法最坏O(N^2), 而Streamlit每次widget交互都会
+# 重跑脚本; 相同的代码对直接命中缓存, 不再重复计算
+@st.cache_data(max_entries=64, show_spinner=False)
 def render_diff(code_a: str, code_b: str) -> str:
     """生成并渲染两段代码的HTML差异。"""
     dmp = diff_match_patch()
+    # 给diff计算设置1秒上限, 避免病态输入拖垮UI线程
+    dmp.Diff_Timeout = 1.0
     diffs = dmp.diff_main(code_a, code_b)
     dmp.diff_cleanupSemantic(diffs)
     return dmp.diff_prettyHtml(diffs)
@@ -61,34 +71,57 @@ def display_status(
                 st.write("等待启动...")
 
 
-async def poll_workflow_status(
-    handle: WorkflowHandle, status_container: Any
-) -> Dict[str, Any]:
-    """轮询工作流状态直到其完成。"""
-    while True:
+async def fetch_workflow_state(
+    handle: WorkflowHandle,
+) -> Tuple[Optional[MainWorkflowStatus], Optional[Dict[str, Any]]]:
+    """
+    对工作流做一次状态采样。
+    先用describe()判断工作流是否已终结——只有终结后才调用result(),
+    取代原先每100ms用wait_for(result, 0.1)探测完成的查询风暴。
+    运行中返回(实时状态, None); 已终结返回(None, 最终结果)。
+    """
+    description = await handle.describe()
+    if (
+        description.status is not None
+        and description.status != WorkflowExecutionStatus.RUNNING
+    ):
         try:
-            # 使用查询来获取实时状态
-            status = await handle.query("get_status")
-            display_status(status_container, status)
-            # 检查工作流是否已完成
-            # 这是一个技巧: 尝试用0.1秒超时获取结果
-            try:
-                return await asyncio.wait_for(handle.result(), timeout=0.1)
-            except asyncio.TimeoutError:
-                # 工作流仍在运行
-                pass
-        except Exception as e:
-            status_container.error(f"查询工作流状态时出错: {e}")
-            # 发生查询错误时, 直接尝试获取最终结果
-            break
-        time.sleep(2)  # 等待2秒后再次轮询
-
-    # 如果循环中断, 说明工作流可能已完成或出错, 获取最终结果
+            return None, await handle.result()
+        except WorkflowFailureError as e:
+            return None, {"status": "FAILED", "message": str(e.cause)}
+    return await handle.query("get_status"), None
+
+
+@st.fragment(run_every=2)
+def monitor_workflow() -> None:
+    """
+    每2秒只重跑这一个片段, 而不是整个页面:
+    其余widget在轮询期间保持可交互, Temporal侧每次轮询只有一次describe
+    加一次query(工作流终结后再加一次result)。
+    """
+    handle = st.session_state.workflow_handle
+    if handle is None:
+        return
+    st.write(f"当前监控的工作流ID: **{handle.id}**")
+    status_placeholder = st.empty()
     try:
-        return await handle.result()
-    except WorkflowFailureError as e:
-        st.error(f"工作流执行失败: {e.cause}")
-        return {"status": "FAILED", "message": str(e.cause)}
+        status, result = run_on_temporal_loop(fetch_workflow_state(handle))
+    except Exception as e:
+        status_placeholder.error(f"查询工作流状态时出错: {e}")
+        return
+    if result is None:
+        display_status(status_placeholder, status)
+        # 事件历史按需流式展开: st.write_stream逐条消费异步生成器,
+        # 不会为取整段历史而阻塞脚本线程
+        with st.expander("工作流事件历史"):
+            st.write_stream(bridge_async(iter_workflow_events(handle)))
+        return
+    # 工作流已终结: 记录结果并触发一次完整重跑来渲染最终视图。
+    # fragment内的st.rerun()默认只重跑fragment自身, 必须显式扩到整个应用,
+    # 否则main()里的"最终结果"区块不会重新渲染
+    st.session_state.workflow_result = result
+    st.session_state.workflow_handle = None
+    st.rerun(scope="app")
 
 
 def main() -> None:
@@ -99,6 +132,8 @@ def main() -> None:
         st.session_state.session_id = str(uuid.uuid4())
     if "workflow_handle" not in st.session_state:
         st.session_state.workflow_handle = None
+    if "workflow_result" not in st.session_state:
+        st.session_state.workflow_result = None
 
     # 从缓存中获取Temporal客户端
     try:
@@ -134,8 +169,15 @@ def main() -> None:
             )
             with st.spinner("正在启动工作流..."):
                 try:
-                    handle = asyncio.run(start_workflow(client, request.model_dump()))
+                    handle = run_on_temporal_loop(
+                        start_workflow(
+                            client,
+                            request.model_dump(),
+                            get_workflow_id_prefix(),
+                        )
+                    )
                     st.session_state.workflow_handle = handle
+                    st.session_state.workflow_result = None
                     st.success(f"工作流已成功启动! ID: {handle.id}")
                     st.info("您现在可以实时监控其进度。")
                 except Exception as e:
@@ -145,12 +187,11 @@ def main() -> None:
     if st.session_state.workflow_handle:
         st.divider()
         st.header("工作流实时监控")
-        st.write(f"当前监控的工作流ID: **{st.session_state.workflow_handle.id}**")
-        status_placeholder = st.empty()
-        result = asyncio.run(
-            poll_workflow_status(st.session_state.workflow_handle, status_placeholder)
-        )
+        monitor_workflow()
 
+    if st.session_state.workflow_result is not None:
+        result = st.session_state.workflow_result
+        st.divider()
         st.header("最终结果")
         if result.get("status") == "SUCCESS":
             st.success(f"工作流成功完成: {result.get('message')}")
@@ -168,9 +209,6 @@ def main() -> None:
             st.error(f"工作流失败或被回滚: {result.get('message')}")
             st.json(result)
 
-        # 清理状态以便下次运行
-        st.session_state.workflow_handle = None
-
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,45 +1,243 @@
 # /ui/src/ui/temporal_client.py
 
 import asyncio
-from typing import Any
+import threading
+import uuid
+from typing import Any, AsyncIterator, Coroutine, Iterator, List, Optional, TypeVar
 
 import streamlit as st
+from common.converter import make_data_converter
+from temporalio.api.enums.v1 import EventType
 from temporalio.client import Client, WorkflowHandle
 
 from.config import get_settings
 
 # 获取UI配置
 settings = get_settings()
+# 热路径使用的配置绑定为模块常量, 省去每次pydantic的__getattr__查找
+TASK_QUEUE = settings.TASK_QUEUE
 
+T = TypeVar("T")
 
-@st.cache_resource
-def get_temporal_client() -> Client:
-    """
-    获取一个缓存的Temporal客户端实例。
-    使用`st.cache_resource`确保在整个用户会话中只创建一个客户端。
-    """
+# 进程级的Temporal事件循环: 由一个长驻守护线程持有并run_forever。
+# Temporal客户端的gRPC通道绑定在创建它的循环上, 把循环和客户端都
+# 做成进程级单例后, N个并发会话的连接建立成本从N次降到1次,
+# 且每次调用不再有事件循环的创建/销毁开销。
+_loop_lock = threading.Lock()
+_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _get_temporal_loop() -> asyncio.AbstractEventLoop:
+    """懒初始化进程级事件循环及其守护线程。"""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=_loop.run_forever, name="temporal-loop", daemon=True
+            ).start()
+    return _loop
+
+
+def run_on_temporal_loop(coro: Coroutine[Any, Any, T]) -> T:
+    """在进程级Temporal事件循环上执行协程, 阻塞当前脚本线程直到完成。"""
+    return asyncio.run_coroutine_threadsafe(coro, _get_temporal_loop()).result()
 
-    async def _connect() -> Client:
+
+# 客户端单例的双重检查锁。st.cache_resource首次填充时的竞态目前因GIL
+# 而无害, 但在thread-per-session乃至free-threaded CPython下, 两个会话
+# 可能同时进入连接逻辑并各建一条通道; 显式加锁让"只有一个客户端"的
+# 保证不依赖GIL。temporalio的Client本身是线程安全的(gRPC通道如此),
+# 跨线程共享单例是可靠的。
+_client_lock = threading.Lock()
+_client_singleton: Optional[Client] = None
+
+
+# 连接重试参数: 指数退避, 吸收Temporal前端启动竞态等瞬时故障
+_CONNECT_MAX_ATTEMPTS = 5
+_CONNECT_BACKOFF_BASE_SECONDS = 0.5
+
+
+async def _connect() -> Client:
+    """带指数退避重试的连接逻辑, 瞬时失败不会污染缓存的连接结果。"""
+    for attempt in range(1, _CONNECT_MAX_ATTEMPTS + 1):
         try:
-            client = await Client.connect(settings.UI_TEMPORAL_SERVER)
+            # 必须与Worker使用同一个DataConverter: Worker压缩过的
+            # 结果/查询响应只有配了相同codec的客户端才能解码
+            client = await Client.connect(
+                settings.UI_TEMPORAL_SERVER, data_converter=make_data_converter()
+            )
             print("Successfully connected to Temporal server.")
             return client
         except Exception as e:
-            print(f"Failed to connect to Temporal server: {e}")
-            # 在Streamlit中, 抛出异常会显示一个错误消息
-            raise
+            print(
+                f"Failed to connect to Temporal server "
+                f"(attempt {attempt}/{_CONNECT_MAX_ATTEMPTS}): {e}"
+            )
+            if attempt == _CONNECT_MAX_ATTEMPTS:
+                # 在Streamlit中, 抛出异常会显示一个错误消息
+                raise
+            await asyncio.sleep(_CONNECT_BACKOFF_BASE_SECONDS * 2 ** (attempt - 1))
+    raise RuntimeError("unreachable")
+
+
+def _warm_connection() -> "asyncio.Future[Client]":
+    """
+    模块导入时立刻发起连接: TCP+TLS+gRPC握手与用户阅读页面的时间重叠,
+    首次点击通常能直接拿到已就绪的客户端, 而不是同步地付出整个握手延迟。
+    """
+    return asyncio.run_coroutine_threadsafe(_connect(), _get_temporal_loop())
+
+
+_connect_future: Optional["asyncio.Future[Client]"] = _warm_connection()
+
+
+async def _aclose_client(client: Client) -> None:
+    """关闭客户端底层的gRPC通道与keepalive任务。"""
+    await client.service_client.close()
+
+
+def _release_client(client: Client) -> None:
+    """缓存淘汰回调: 在Temporal循环上关闭客户端, 防止FD/连接泄漏。"""
+    global _client_singleton
+    with _client_lock:
+        if _client_singleton is client:
+            _client_singleton = None
+    asyncio.run_coroutine_threadsafe(
+        _aclose_client(client), _get_temporal_loop()
+    ).result(timeout=5)
+
+
+# ttl主动回收陈旧通道; on_release确保被淘汰(TTL/内存压力/应用重载)的
+# 客户端立刻关闭gRPC通道, 而不是挂着HTTP/2连接和keepalive任务等GC
+@st.cache_resource(show_spinner=False, ttl="30m", on_release=_release_client)
+def get_temporal_client() -> Client:
+    """
+    获取进程级共享的Temporal客户端实例。
+    无参数的`st.cache_resource`刻意没有缓存键变化: 客户端是进程全局的,
+    在所有会话和线程间共享, 单条HTTP/2通道复用全部RPC——N个会话
+    只占用Temporal前端的1个连接。它在进程级事件循环上创建, 后续所有
+    调用也通过run_on_temporal_loop跑在同一个循环上。
+    若将来需要按namespace隔离, 应显式暴露为get_temporal_client(namespace),
+    让缓存键明确且有界, 而不是隐式地退化为每会话一个客户端。
+    """
+    global _client_singleton, _connect_future
+
+    # 双重检查: 无锁快路径 + 锁内复查, cache_resource作为dev-reload下的
+    # 第二层缓存保留
+    if _client_singleton is not None:
+        return _client_singleton
+    with _client_lock:
+        if _client_singleton is None:
+            # 优先消费导入时预热的连接; 预热失败(重试耗尽)则重新发起,
+            # 失败的future只消费一次, 不会永久毒化后续调用
+            future = _connect_future
+            _connect_future = None
+            if future is not None:
+                _client_singleton = future.result()
+            else:
+                _client_singleton = run_on_temporal_loop(_connect())
+        return _client_singleton
 
-    # Streamlit在顶层不支持await, 所以我们用asyncio.run来执行异步连接
-    return asyncio.run(_connect())
 
+def get_workflow_id_prefix() -> str:
+    """每会话计算一次工作流ID前缀, 后续启动只做一次字符串拼接。"""
+    if "wf_id_prefix" not in st.session_state:
+        st.session_state.wf_id_prefix = f"code-gen-ui-{st.session_state.session_id}"
+    return st.session_state.wf_id_prefix
 
-async def start_workflow(client: Client, request_data: dict[str, Any]) -> WorkflowHandle:
-    """异步启动一个新的工作流。"""
+
+async def start_workflow(
+    client: Client, request_data: dict[str, Any], id_prefix: str
+) -> WorkflowHandle:
+    """
+    异步启动一个新的工作流。
+    id_prefix由调用方传入(见get_workflow_id_prefix), 协程本身不碰
+    Streamlit运行时, 可以在任意线程/循环上执行。
+    """
     # 使用`start_workflow`并立即返回handle, 不等待其完成
     handle = await client.start_workflow(
         "MainSagaWorkflow",
         request_data,
-        id=f"code-gen-ui-{st.session_state.session_id}",
-        task_queue=settings.TASK_QUEUE,
+        id=id_prefix,
+        task_queue=TASK_QUEUE,
     )
-    return handle
\ No newline at end of file
+    return handle
+
+
+async def start_workflow_with_signal(
+    client: Client,
+    request_data: dict[str, Any],
+    id_prefix: str,
+    signal_name: str,
+    signal_arg: Any,
+) -> WorkflowHandle:
+    """
+    以signal-with-start方式启动工作流: Start和首个Signal融合为一次RPC,
+    相比"先start再signal"省掉一个完整的网络往返。
+    request_eager_start允许工作流在处理Start响应的同一worker进程上
+    立即被调度, 跳过一次任务队列轮询。
+    """
+    return await client.start_workflow(
+        "MainSagaWorkflow",
+        request_data,
+        id=id_prefix,
+        task_queue=TASK_QUEUE,
+        start_signal=signal_name,
+        start_signal_args=[signal_arg],
+        request_eager_start=True,
+    )
+
+
+async def start_workflows_bulk(
+    client: Client,
+    items: List[dict[str, Any]],
+    id_prefix: str,
+    max_concurrency: int = 8,
+) -> List[WorkflowHandle]:
+    """
+    并发启动一批工作流。
+    SDK在单个gRPC通道上完全异步, N个Start RPC在事件循环上重叠进行,
+    而不是串行地付N次往返; 信号量限制同时在途的RPC数, 避免压垮
+    Temporal前端的限流。每个工作流ID带独立后缀——复用会话ID会让第二个
+    并发启动直接报WorkflowAlreadyStarted。
+    id_prefix由调用方在脚本线程上通过get_workflow_id_prefix()计算后传入:
+    本协程跑在temporal-loop线程上, 那里没有ScriptRunContext,
+    读st.session_state会静默落到错误的全局状态(与start_workflow同约定)。
+    """
+    sem = asyncio.Semaphore(max_concurrency)
+
+    async def _one(request_data: dict[str, Any]) -> WorkflowHandle:
+        async with sem:
+            return await client.start_workflow(
+                "MainSagaWorkflow",
+                request_data,
+                id=f"{id_prefix}-{uuid.uuid4().hex[:8]}",
+                task_queue=TASK_QUEUE,
+            )
+
+    return await asyncio.gather(*(_one(item) for item in items))
+
+def _format_event(event: Any) -> str:
+    """把一条历史事件格式化为单行文本。"""
+    return f"#{event.event_id} {EventType.Name(event.event_type)}\n"
+
+
+async def iter_workflow_events(handle: WorkflowHandle) -> AsyncIterator[str]:
+    """异步迭代工作流的历史事件, 逐条产出格式化文本。"""
+    async for event in handle.fetch_history_events():
+        yield _format_event(event)
+
+
+def bridge_async(gen: AsyncIterator[T]) -> Iterator[T]:
+    """
+    把进程级Temporal循环上的异步生成器桥接为同步迭代器,
+    供st.write_stream消费: 脚本线程只在真正有新数据时前进一步,
+    而不是用固定间隔的整批查询去轮询。
+    """
+    loop = _get_temporal_loop()
+    while True:
+        try:
+            yield asyncio.run_coroutine_threadsafe(gen.__anext__(), loop).result()
+        except StopAsyncIteration:
+            return